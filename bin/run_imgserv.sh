@@ -20,5 +20,23 @@ celery -A lsst.dax.imgserv.jobqueue.imageworker worker --detach \
 --logfile /tmp/imageworker_jobqueue.log
 
 # start imgserv
+# cutouts are CPU bound, so run one uwsgi worker process per CPU available
+# to the container unless set otherwise. nproc reports the CPUs of the node,
+# so the CFS quota of the cgroup (v2, then v1) takes precedence.
+cpu_quota() {
+    local quota period
+    if [ -r /sys/fs/cgroup/cpu.max ]; then
+        read quota period < /sys/fs/cgroup/cpu.max
+    elif [ -r /sys/fs/cgroup/cpu/cpu.cfs_quota_us ]; then
+        quota=$(cat /sys/fs/cgroup/cpu/cpu.cfs_quota_us)
+        period=$(cat /sys/fs/cgroup/cpu/cpu.cfs_period_us)
+    fi
+    if [ -n "$quota" ] && [ "$quota" != "max" ] && [ "$quota" -gt 0 ]; then
+        echo $(( (quota + period - 1) / period ))
+    else
+        nproc
+    fi
+}
+export UWSGI_PROCESSES=${UWSGI_PROCESSES:-$(cpu_quota)}
 export LD_LIBRARY_PATH=$LD_LIBRARY_PATH:$CONDA_PREFIX/lib
 uwsgi --ini /etc/uwsgi/uwsgi.ini
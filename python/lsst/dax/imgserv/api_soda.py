@@ -24,31 +24,41 @@ This module implements the REST interface for Image Cutout Service.
 Corresponding URI: /api/image/soda
 
 """
+import gzip
 import os
 import os.path
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 
 import traceback
-import tempfile
 import json
 import base64
+import uuid
 from http import HTTPStatus
 
 from flask import Blueprint, make_response, request, current_app, session
+from flask import Response, stream_with_context
 from flask import render_template, send_file, url_for, redirect
 from werkzeug.exceptions import HTTPException
 
-from jsonschema import validate
+from jsonschema import validators
 
 import lsst.log as log
+import lsst.afw.fits as afw_fits
 
 from .exceptions import ImageNotFoundError, UsageError
+from .cutoutcache import CutoutCache
+from .hashutil import Hasher
 from .vo.imageSODA import ImageSODA
 from .metaGet import MetaGet
 from .jsonutil import get_params
 from .jobqueue.imageworker import make_celery, app_celery
 import etc.imgserv.imgserv_config as imgserv_config
 
+# maximum number of rendered service documents kept, over all root URLs
+_MAX_RENDERED_DOCS = 64
+
 image_soda = Blueprint("api_image_soda", __name__, static_folder="static",
                        template_folder="templates")
 
@@ -86,7 +96,7 @@ def check_auth():
             p = base64.urlsafe_b64decode(p)
             user_name = json.loads(p).get("uid")
             session["user"] = user_name # keep it in flask session object
-            log.info("JWT received for user: {}".format(user_name))
+            log.info("JWT received for user: %s", user_name)
         except(UnicodeDecodeError, TypeError, ValueError):
             log.info("unexpected error in JWT")
 
@@ -120,8 +130,19 @@ def load_imgserv_config(config_path=None, dataset=None, metaserv_url=None):
             "dax.imgserv.meta.url"]
     current_app.config["imgserv_api"] = os.path.join(config_path,
                                                      "image_api_schema.json")
+    # compile the schema validator for JSON requests once
+    with open(current_app.config["imgserv_api"]) as f:
+        schema = json.load(f)
+    current_app.imgserv_validator = validators.validator_for(schema)(schema)
     # create cache for butler instances
     current_app.butler_instances = {}
+    # create cache for metaget instances (db engine per dataset)
+    current_app.metaget_instances = {}
+    # create cache for the rendered service documents
+    current_app.rendered_docs = {}
+    # create cache for serialized /sync responses
+    current_app.cutout_cache = CutoutCache(
+        imgserv_config.MAX_CUTOUT_CACHE_SIZE)
     # create SODA service
     current_app.soda = ImageSODA(current_app.config)
     # Instantiate celery for client access
@@ -131,32 +152,38 @@ def load_imgserv_config(config_path=None, dataset=None, metaserv_url=None):
 @image_soda.route("/")
 def img_index():
     """ Get the service endpoint status. """
-    return make_response(render_template("api_image_soda.html"))
+    html = _rendered("index", lambda: render_template("api_image_soda.html"))
+    resp = make_response(html)
+    resp.headers["Cache-Control"] = imgserv_config.DOC_CACHE_CONTROL
+    return resp
 
 
 @image_soda.route("/availability", methods=["GET"])
 def img_availability():
     """ Get the service availability status. """
-    xml = current_app.soda.get_availability(_getparams())
-    resp = make_response(xml)
-    resp.headers["Content-Type"] = "text/xml"
-    return resp
+    xml = _rendered("availability",
+                    lambda: current_app.soda.get_availability(_getparams()))
+    return _make_response_xml(xml)
 
 
 @image_soda.route("/capabilities", methods=["GET"])
 def img_capabilities():
     """ Get the service capabilities."""
-    xml = current_app.soda.get_capabilities(_getparams())
-    resp = make_response(xml)
-    resp.headers["Content-Type"] = "text/xml"
+    xml = _rendered("capabilities",
+                    lambda: current_app.soda.get_capabilities(_getparams()))
+    resp = _make_response_xml(xml)
+    resp.headers["Cache-Control"] = imgserv_config.DOC_CACHE_CONTROL
     return resp
 
 
 @image_soda.route("/examples", methods=["GET"])
 def img_examples():
     """ Get /examples for the service. """
-    html = current_app.soda.get_examples(_getparams())
-    return make_response(html)
+    html = _rendered("examples",
+                     lambda: current_app.soda.get_examples(_getparams()))
+    resp = make_response(html)
+    resp.headers["Cache-Control"] = imgserv_config.DOC_CACHE_CONTROL
+    return resp
 
 
 @image_soda.route("/tables", methods=["GET"])
@@ -176,7 +203,8 @@ def img_sia():
 @image_soda.route("/adql", methods=["GET"])
 def img_adql():
     """" Get the /adql service endpoint."""
-    metaget = MetaGet(current_app.config["DAX_IMG_META_URL"])
+    ds = imgserv_config.config_datasets["default"]
+    metaget = MetaGet.get_metaget(ds, current_app.config)
     params = _getparams()
     pos = params["POS"]
     ra, dec, radius = pos.split(" ")
@@ -199,14 +227,61 @@ def img_sync():
         return _service_response(soda_url)
     _params = _getparams()
     _check_soda_param(_params)
-    image = current_app.soda.do_sync(_params)
-    with tempfile.NamedTemporaryFile(prefix="img_", suffix=".fits") as fp:
-        image.writeFits(fp.name)
-        resp = send_file(fp.name,
-                         mimetype="image/fits",
-                         as_attachment=True,
-                         attachment_filename=os.path.basename(fp.name))
+    # the cutout is determined by the request, so the ETag is derived from
+    # the normalized parameters, and a revalidation needs no image access.
+    key = CutoutCache.make_key(_params)
+    gzipped = request.accept_encodings["gzip"] > 0
+    etag = Hasher.md5(key) + ("-gzip" if gzipped else "")
+    if request.if_none_match.contains(etag):
+        resp = Response(status=HTTPStatus.NOT_MODIFIED)
+        resp.set_etag(etag)
+        resp.vary.add("Accept-Encoding")
+        resp.headers["Cache-Control"] = imgserv_config.CUTOUT_CACHE_CONTROL
         return resp
+    data, etag = _sync_fits(_params, key, gzipped=gzipped)
+    resp = _fits_response(data, etag, gzipped=gzipped)
+    resp.headers["Cache-Control"] = imgserv_config.CUTOUT_CACHE_CONTROL
+    return resp
+
+
+@image_soda.route("/sync/batch", methods=["POST"])
+def img_sync_batch():
+    """ Service a batch of /sync requests in one round trip (LSST extension).
+
+    The request body is a JSON array of SODA parameter sets, e.g.
+        [{"ID": "ci_hsc.calexp.r", "POS": "CIRCLE 320.38 -0.32 0.01"}, ...]
+    An entry may also be a JSON request document, as accepted by /sync.
+
+    Returns
+    -------
+    resp : `flask.Response`
+        multipart/mixed, one part per parameter set in request order.
+    """
+    batch = request.get_json(silent=True)
+    if not isinstance(batch, list) or not batch:
+        raise UsageError("Expected a JSON array of SODA parameters")
+    if len(batch) > imgserv_config.MAX_CUTOUT_BATCH_SIZE:
+        raise UsageError(f"Batch exceeded "
+                         f"{imgserv_config.MAX_CUTOUT_BATCH_SIZE} requests")
+    params_list = []
+    for p in batch:
+        if not isinstance(p, dict):
+            raise UsageError("Expected a JSON array of SODA parameters")
+        # an entry is either a JSON request as for /sync, or the parameters
+        # as they would be in the query string
+        if "image" in p:
+            params = _json_params(p)
+        elif all(isinstance(v, str) for v in p.values()):
+            params = dict(p)
+        else:
+            raise UsageError("Expected SODA parameter values as strings")
+        params["API"] = "SODA"
+        _check_soda_param(params)
+        params_list.append(params)
+    boundary = uuid.uuid4().hex
+    return Response(stream_with_context(_multipart_fits(params_list,
+                                                        boundary)),
+                    content_type=f"multipart/mixed; boundary={boundary}")
 
 
 @image_soda.route("/async", methods=["GET", "POST"])
@@ -216,9 +291,7 @@ def img_async():
         """ Get all the jobs of the user in the system. """
         if session.get("user"):
             xml = current_app.soda.get_jobs(_getparams())
-            resp = make_response(xml)
-            resp.headers["Content-Type"] = "text/xml"
-            return resp
+            return _make_response_xml(xml)
         else:
             soda_url = url_for('api_image_soda.img_async', _external=True)
             return _service_response(soda_url)
@@ -226,7 +299,9 @@ def img_async():
     _check_soda_param(_params)
     # new job for request
     job_id = current_app.soda.do_async(_params)
-    return redirect(url_for('api_image_soda.img_async_job', job_id=job_id, _external=True))
+    # UWS: 303 See Other to the job resource, the work runs in the worker
+    return redirect(url_for('api_image_soda.img_async_job', job_id=job_id,
+                            _external=True), code=HTTPStatus.SEE_OTHER)
 
 
 @image_soda.route("/async/<job_id>", methods=["GET"])
@@ -242,33 +317,7 @@ def img_async_job(job_id: str):
     xml: `str`
         the job description.
     """
-    ar = app_celery.AsyncResult(job_id)
-    phase = map_phase_from_state[ar.state]
-    soda_pos, duration, creation_time, start_time, end_time = "NA", "NA", \
-                                                              "NA", "NA", "NA"
-    if ar.ready():
-        result = ar.get()
-        creation_time = datetime.fromtimestamp(result.get("job_creation_time"))
-        start_time = datetime.fromtimestamp(result.get("job_start_time"))
-        end_time = datetime.fromtimestamp(result.get("job_end_time"))
-        duration = (end_time - start_time).total_seconds()
-        soda_pos = result.get("soda_params")["POS"]
-    result_url = url_for('api_image_soda.img_async_job_results_result',
-                         job_id=job_id,
-                         _external=True)
-    resp = make_response(render_template("uws_job_descriptor.xml",
-                                         job_id=job_id,
-                                         job_phase=phase,
-                                         job_creation_time=creation_time,
-                                         job_start_time=start_time,
-                                         job_end_time=end_time,
-                                         job_duration=duration,
-                                         job_result_id=job_id,
-                                         job_result=result_url,
-                                         soda_pos=soda_pos),
-                         HTTPStatus.OK)
-    resp.headers["Content-Type"] = "text/xml"
-    return resp
+    return _job_response(job_id, "uws_job_descriptor.xml")
 
 
 @image_soda.route("/async/<job_id>/phase", methods=["GET"])
@@ -376,33 +425,7 @@ def img_async_job_results(job_id: str):
     """
     # TODO: DM-20853 Handle multiple results per job
     # For now redirect to single result
-    ar = app_celery.AsyncResult(job_id)
-    soda_pos, duration, creation_time, start_time, end_time = "NA", "NA", \
-                                                              "NA", "NA", "NA"
-    if ar.ready():
-        result = ar.get()
-        creation_time = datetime.fromtimestamp(result.get("job_creation_time"))
-        start_time = datetime.fromtimestamp(result.get("job_start_time"))
-        end_time = datetime.fromtimestamp(result.get("job_end_time"))
-        duration = (end_time - start_time).total_seconds()
-        soda_pos = result.get("soda_params")["POS"]
-    phase = map_phase_from_state[ar.state]
-    result_url = url_for('api_image_soda.img_async_job_results_result',
-                         job_id=job_id,
-                         _external=True)
-    resp = make_response(render_template("uws_job_result.xml",
-                                         job_id=job_id,
-                                         job_phase=phase,
-                                         job_creation_time=creation_time,
-                                         job_start_time=start_time,
-                                         job_end_time=end_time,
-                                         job_duration=duration,
-                                         soda_pos=soda_pos,
-                                         job_result_id=job_id,
-                                         job_result=result_url),
-                         HTTPStatus.OK)
-    resp.headers["Content-Type"] = "text/xml"
-    return resp
+    return _job_response(job_id, "uws_job_result.xml")
 
 
 @image_soda.route("/async/<job_id>/results/result", methods=["GET"])
@@ -426,7 +449,8 @@ def img_async_job_results_result(job_id: str):
             resp = send_file(fn_out,
                              mimetype="image/fits",
                              as_attachment=True,
-                             attachment_filename=os.path.basename(fn_out))
+                             attachment_filename=os.path.basename(fn_out),
+                             conditional=True)
             return resp
         else:  # FAILURE
             return _make_response_plain(f"TaskFailed={ar.result}",
@@ -493,28 +517,250 @@ def unhandled_exceptions(error):
                                     HTTPStatus.BAD_REQUEST)
     elif type(error) == ImageNotFoundError:
         return _image_not_found(f"Error={error}")
+    elif isinstance(error, HTTPException):
+        # keep the status of the HTTP error (e.g. 404, 405)
+        return _make_response_plain(f"Error={error.description}",
+                                    error.code)
     else:
+        # keep the traceback server side, unless debugging
+        log.error("%s: %s\n%s", error.__class__.__name__, error,
+                  traceback.format_exc())
         err = {
             "exception": error.__class__.__name__,
-            "message": error.args[0],
-            "traceback": traceback.format_exc()
+            "message": str(error.args[0]) if error.args else ""
         }
+        if current_app.debug:
+            err["traceback"] = traceback.format_exc()
         if len(error.args) > 1:
             err["more"] = [str(arg) for arg in error.args[1:]]
         return _make_response_plain("Error=" + str(err),
                                     HTTPStatus.INTERNAL_SERVER_ERROR)
 
 
+def _job_response(job_id: str, template: str):
+    """ Render the UWS job info, including path to result if ready.
+
+    Parameters
+    ----------
+    job_id : `str`
+    template : `str`
+        the UWS template to render.
+    """
+    ar = app_celery.AsyncResult(job_id)
+    phase = map_phase_from_state[ar.state]
+    soda_pos, duration, creation_time, start_time, end_time = "NA", "NA", \
+                                                              "NA", "NA", "NA"
+    if ar.ready():
+        result = ar.get()
+        creation_time = datetime.fromtimestamp(result.get("job_creation_time"))
+        start_time = datetime.fromtimestamp(result.get("job_start_time"))
+        end_time = datetime.fromtimestamp(result.get("job_end_time"))
+        duration = (end_time - start_time).total_seconds()
+        soda_pos = result.get("soda_params")["POS"]
+    result_url = url_for('api_image_soda.img_async_job_results_result',
+                         job_id=job_id,
+                         _external=True)
+    return _make_response_xml(render_template(template,
+                                              job_id=job_id,
+                                              job_phase=phase,
+                                              job_creation_time=creation_time,
+                                              job_start_time=start_time,
+                                              job_end_time=end_time,
+                                              job_duration=duration,
+                                              job_result_id=job_id,
+                                              job_result=result_url,
+                                              soda_pos=soda_pos))
+
+
+def _rendered(name: str, render):
+    """ Get the rendered service document, rendering it on first use.
+
+    The documents are constant except for the external URLs they embed,
+    so they are cached per root URL (host and script root) of the request.
+
+    Parameters
+    ----------
+    name : `str`
+        the document name.
+    render : `callable`
+        renders the document.
+    """
+    key = (name, request.url_root)
+    doc = current_app.rendered_docs.get(key)
+    if doc is None:
+        doc = render()
+        # the host is client supplied, so bound the number of variants
+        if len(current_app.rendered_docs) < _MAX_RENDERED_DOCS:
+            current_app.rendered_docs[key] = doc
+    return doc
+
+
 def _service_response(soda_url):
     """ Get the service info using DALI template.
     Parameters
     ----------
     soda_url : `str`
     """
-    resp = make_response(render_template("soda_descriptor.xml",
-                                         soda_ep=soda_url),
-                         HTTPStatus.OK)
-    resp.headers["Content-Type"] = "text/xml"
+    return _make_response_xml(render_template("soda_descriptor.xml",
+                                              soda_ep=soda_url))
+
+
+def _sync_fits(params: dict, key: tuple = None, gzipped: bool = False):
+    """ Get the serialized image for the /sync request, from the cache if
+    available.
+
+    Parameters
+    ----------
+    params : `dict`
+        the request parameters.
+    key : `tuple`
+        the cache key of the parameters, if already computed.
+    gzipped : `bool`
+        get the image compressed with gzip content encoding.
+
+    Returns
+    -------
+    data, etag : `bytes`, `str`
+        the serialized image and its ETag.
+    """
+    if key is None:
+        key = CutoutCache.make_key(params)
+    cache = current_app.cutout_cache
+    # each encoding is cached on its own, so a hit needs no compression
+    cache_key = key + ("gzip",) if gzipped else key
+    cached = cache.get(cache_key)
+    if cached is None:
+        identity = cache.get(key) if gzipped else None
+        if identity is not None:
+            data = identity[0]
+        else:
+            data = _fits_bytes(current_app.soda.do_sync(params))
+        etag = Hasher.md5(key)
+        if gzipped:
+            # fast compression, as the transfer time is what matters here
+            data = gzip.compress(data, compresslevel=1)
+            etag += "-gzip"
+        cached = (data, etag)
+        cache.put(cache_key, *cached)
+    return cached
+
+
+def _multipart_fits(params_list, boundary):
+    """ Generate the multipart/mixed body for the batch of /sync requests.
+
+    Failed requests are reported in a text/plain part of their own, as the
+    response status has already been sent. Each part has the Content-ID
+    <i@boundary>, where i is the index of its request in the batch.
+
+    Parameters
+    ----------
+    params_list : `list` [`dict`]
+        the request parameters of each part.
+    boundary : `str`
+        the multipart boundary.
+    """
+    app = current_app._get_current_object()
+
+    def _sync_fits_in_app(params):
+        with app.app_context():
+            return _sync_fits(params)
+
+    # cutouts are computed concurrently, and sent in request order
+    n_workers = min(imgserv_config.MAX_CUTOUT_BATCH_WORKERS, len(params_list))
+    with ThreadPoolExecutor(max_workers=n_workers) as pool:
+        pending = deque()
+
+        def _futures():
+            # keep only n_workers cutouts in flight, so the results held
+            # while an earlier part is being sent stay bounded
+            for p in params_list:
+                pending.append(pool.submit(_sync_fits_in_app, p))
+                if len(pending) == n_workers:
+                    yield pending.popleft()
+            while pending:
+                yield pending.popleft()
+
+        try:
+            yield from _multipart_parts(_futures(), boundary)
+        finally:
+            # client gone: skip the cutouts not started yet
+            for f in pending:
+                f.cancel()
+
+
+def _multipart_parts(futures, boundary):
+    """ Generate the parts of the multipart/mixed body from the results.
+
+    Parameters
+    ----------
+    futures : `iterable` [`concurrent.futures.Future`]
+        the pending results of each part, in request order.
+    boundary : `str`
+        the multipart boundary.
+    """
+    for i, future in enumerate(futures):
+        try:
+            data, _ = future.result()
+            headers = f"Content-Type: image/fits\r\n" \
+                      f"Content-Disposition: attachment; " \
+                      f"filename=image_{i}.fits"
+        except Exception as e:
+            # the status has been sent: report the error in the part, so
+            # the remaining parts still follow
+            if not isinstance(e, (UsageError, ImageNotFoundError)):
+                log.error("%s: %s\n%s", e.__class__.__name__, e,
+                          traceback.format_exc())
+            data = f"{e.__class__.__name__}={e}".encode("utf-8")
+            headers = "Content-Type: text/plain"
+        headers += f"\r\nContent-ID: <{i}@{boundary}>"
+        yield f"--{boundary}\r\n{headers}\r\n\r\n".encode("utf-8")
+        yield data
+        yield b"\r\n"
+        # the part is written: release its result
+        del future, data
+    yield f"--{boundary}--\r\n".encode("utf-8")
+
+
+def _fits_bytes(image) -> bytes:
+    """ Serialize the image into FITS in memory.
+
+    Parameters
+    ----------
+    image : `lsst.afw.image`
+        the image object.
+    """
+    mem = afw_fits.MemFileManager()
+    image.writeFits(mem)
+    return mem.getData()
+
+
+def _fits_response(data: bytes, etag: str = None,
+                   file_name: str = "image.fits", gzipped: bool = False):
+    """ Generate the FITS response, honoring conditional requests.
+
+    Parameters
+    ----------
+    data : `bytes`
+        the serialized image.
+    etag : `str`
+        the ETag of the data, if any.
+    file_name : `str`
+        the attachment file name.
+    gzipped : `bool`
+        the data is compressed with gzip content encoding.
+    """
+    # the body is already in memory: send it as is, with its length known
+    # up front, rather than through send_file() which neither sets
+    # Content-Length nor can hash a file object for an ETag.
+    resp = Response(data, mimetype="image/fits", direct_passthrough=True)
+    resp.headers["Content-Length"] = str(len(data))
+    resp.headers["Content-Disposition"] = f"attachment; filename={file_name}"
+    if gzipped:
+        resp.headers["Content-Encoding"] = "gzip"
+    resp.vary.add("Accept-Encoding")
+    if etag:
+        resp.set_etag(etag)
+        resp = resp.make_conditional(request)
     return resp
 
 
@@ -531,28 +777,31 @@ def _make_response_plain(info: str, http_status: int=HTTPStatus.OK):
     return resp
 
 
+def _make_response_xml(xml: str, http_status: int = HTTPStatus.OK):
+    """ Generate the XML response.
+
+    Parameters
+    ----------
+    xml : `str`
+        the XML document.
+    http_status : `int`
+        the HTTP status code.
+    """
+    return Response(xml, status=http_status, content_type="text/xml")
+
+
 @image_soda.errorhandler(HTTPStatus.NOT_FOUND)
 def _image_not_found(msg: str = "Image Not Found"):
     # Return generic error using DALI template.
-    resp = make_response(render_template("dali_response.xml",
-                                         dali_resp_state="Error",
-                                         dali_resp_msg=msg),
-                         HTTPStatus.NOT_FOUND)
-    resp.headers["Content-Type"] = "text/xml"
-    return resp
+    return _make_response_xml(render_template("dali_response.xml",
+                                              dali_resp_state="Error",
+                                              dali_resp_msg=msg),
+                              HTTPStatus.NOT_FOUND)
 
 
 def _getparams():
     if request.is_json:
-        r_data = request.get_json()
-        # schema validation check
-        check = current_app.config["DAX_IMG_VALIDATE"]
-        if check:
-            f_schema = current_app.config["imgserv_api"]
-            with open(f_schema) as f:
-                schema = json.load(f)
-            validate(r_data, schema)
-        params = get_params(r_data)
+        params = _json_params(request.get_json())
     else:
         if request.content_type and "form" in request.content_type:
             # e.g. Content-Type: application/www-form-urlencoded
@@ -565,6 +814,22 @@ def _getparams():
     return params
 
 
+def _json_params(r_data: dict) -> dict:
+    """ Get the parameters of a JSON request, validated against the schema
+    if so configured.
+
+    Parameters
+    ----------
+    r_data : `dict`
+        the JSON request.
+    """
+    # schema validation check
+    check = current_app.config.get("DAX_IMG_VALIDATE", False)
+    if check:
+        current_app.imgserv_validator.validate(r_data)
+    return get_params(r_data)
+
+
 def _check_soda_param(params):
     if any(param in ["BAND", "TIME", "POL"] for param in params):
         raise UsageError("Invalid SODA parameter")
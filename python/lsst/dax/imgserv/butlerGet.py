@@ -60,7 +60,8 @@ class ButlerGet(object):
         butler = butler_instances.get(datarepo_id)
         if not butler:
             # new butler instance needed
-            log.debug(f"Instantiating Butler Gen3 with data repository: {datarepo_id}")
+            log.debug("Instantiating Butler Gen3 with data repository: %s",
+                      datarepo_id)
             if ds == "default":
                 ds = imgserv_config.config_datasets["default"]
             collection = imgserv_config.config_datasets[ds]["IMG_DEFAULT_COLLECTION"]
@@ -28,7 +28,7 @@ This module implements the command line interface (CLI) to ImageServ.
 
 import os
 import json
-from jsonschema import validate, ValidationError
+from jsonschema import validators, ValidationError
 
 import click
 
@@ -90,8 +90,11 @@ class ImageServCLI(object):
         log.configure(os.path.join(config_dir, "log.properties"))
         self._out_dir = out_dir
         self._dispatcher = Dispatcher(config_dir)
-        self._schema = os.path.join(config_dir, "image_api_schema.json")
         self._validate = self._config.get("DAX_IMG_VALIDATE", False)
+        if self._validate:
+            with open(os.path.join(config_dir, "image_api_schema.json")) as s:
+                schema = json.load(s)
+            self._validator = validators.validator_for(schema)(schema)
         self._config["DAX_IMG_META_URL"] = imgserv_meta_url
 
     def process_request(self, in_req):
@@ -216,10 +219,7 @@ class ImageServCLI(object):
         try:
             if self._validate:
                 # validate the schema
-                with open(self._schema) as s:
-                    schema = json.load(s)
-                    s.close()
-                validate(req, schema)
+                self._validator.validate(req)
         except ValidationError as e:
             raise Exception(f"Validation Error {e.message}")
         params = self._get_params(req)
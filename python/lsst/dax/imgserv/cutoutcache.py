@@ -0,0 +1,125 @@
+# This file is part of dax_imgserv.
+#
+# Developed for the LSST Data Management System.
+# This product includes software developed by the LSST Project
+# (http://www.lsst.org).
+# See the COPYRIGHT file at the top-level directory of this distribution
+# for details of code ownership.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+This module implements a bounded in-memory cache of serialized image
+cutouts, keyed on the normalized request parameters.
+"""
+
+import threading
+from collections import OrderedDict
+
+
+class CutoutCache(object):
+    """ Thread-safe LRU cache of serialized (FITS) cutouts, bounded by the
+    total size of the cached data.
+
+    Parameters
+    ----------
+    max_bytes : `int`
+        the maximum total size of the cached data.
+    """
+
+    def __init__(self, max_bytes):
+        self._max_bytes = max_bytes
+        self._nbytes = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(params):
+        """ Make the cache key for the request parameters.
+
+        The POS value is split on whitespace and commas, and its numeric
+        tokens are normalized, so that equivalent spellings of a region
+        share a key. Other values are kept as given: they are validated
+        after the cache lookup, and must not alias a valid request.
+
+        Parameters
+        ----------
+        params : `dict`
+            the request parameters.
+
+        Returns
+        -------
+        key : `tuple`
+        """
+        items = []
+        for k, v in params.items():
+            if k == "POS":
+                tokens = []
+                for t in str(v).replace(",", " ").split():
+                    try:
+                        t = repr(float(t))
+                    except ValueError:
+                        pass
+                    tokens.append(t)
+                v = " ".join(tokens)
+            items.append((k, str(v)))
+        return tuple(sorted(items))
+
+    def get(self, key):
+        """ Get the cached entry and mark it as most recently used.
+
+        Parameters
+        ----------
+        key : `tuple`
+
+        Returns
+        -------
+        entry : `tuple` (`bytes`, `str`) or `None`
+            the cached data and its ETag.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def put(self, key, data, etag):
+        """ Cache the data, evicting the least recently used entries as
+        needed to stay within the size limit.
+
+        Parameters
+        ----------
+        key : `tuple`
+        data : `bytes`
+            the serialized cutout.
+        etag : `str`
+            the ETag of the data.
+        """
+        size = len(data)
+        if size > self._max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._nbytes -= len(old[0])
+            self._entries[key] = (data, etag)
+            self._nbytes += size
+            while self._nbytes > self._max_bytes:
+                _, (evicted, _) = self._entries.popitem(last=False)
+                self._nbytes -= len(evicted)
+
+    @property
+    def nbytes(self):
+        """ The total size of the cached data. """
+        return self._nbytes
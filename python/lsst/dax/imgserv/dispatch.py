@@ -26,6 +26,7 @@ This module implements the API dispatch logic.
 
 import os
 import json
+import threading
 
 from .exceptions import UsageError
 
@@ -39,15 +40,42 @@ class Dispatcher(object):
     """ Dispatcher maps request to corresponding Image method.
     """
 
+    _dispatcher_instances = {}  # caching Dispatcher per config directory
+    _lock = threading.Lock()
+
     def __init__(self, config_dir):
         """Load and keep ref to the key to API Map."""
         config = os.path.join(config_dir, "api_map.json")
         self.api_map = {}
         with open(config) as f:
             apis = json.load(f)
-            for key in apis.keys():
-                s_key = ",".join(sorted(key.split(",")))
-                self.api_map[s_key] = apis[key]
+        for key, module_func in apis.items():
+            if not isinstance(module_func, str):
+                # not an API binding, e.g. $comment
+                continue
+            s_key = ",".join(sorted(key.split(",")))
+            # resolve the handler once, rather than per request
+            self.api_map[s_key] = eval(module_func)
+
+    @staticmethod
+    def get_dispatcher(config_dir):
+        """Get Dispatcher from cache if available and instantiate if not.
+
+        Parameters
+        ----------
+        config_dir: `str`
+            the directory of api_map.json.
+
+        Returns
+        -------
+        dispatcher : `Dispatcher`
+        """
+        with Dispatcher._lock:
+            dispatcher = Dispatcher._dispatcher_instances.get(config_dir)
+            if dispatcher is None:
+                dispatcher = Dispatcher(config_dir)
+                Dispatcher._dispatcher_instances[config_dir] = dispatcher
+        return dispatcher
 
     def find_api(self, req_params):
         """ Find the API based on its method signature.
@@ -64,12 +92,11 @@ class Dispatcher(object):
         """
         api_params = self._map_soda_params(req_params)
         api_id = self._get_api_id(api_params)
-        module_func = self.api_map.get(api_id)
-        if module_func:
-            api = eval(module_func)
+        api = self.api_map.get(api_id)
+        if api:
             return api, api_params
         else:
-            raise Exception("Dispatcher: API method not Found")
+            raise UsageError("Dispatcher: API method not Found")
 
     @staticmethod
     def _get_api_id(api_params):
@@ -84,30 +111,52 @@ class Dispatcher(object):
     def _map_soda_params(req):
         """ Map the SODA parameters from the request.
         """
-        ds, ds_type, filt = req["ID"].split(".")
+        ds_id = req.get("ID", None)
+        if ds_id is None:
+            raise UsageError("Missing ID parameter")
+        if not isinstance(ds_id, str):
+            raise UsageError("Invalid ID parameter, expected a string")
+        try:
+            ds, ds_type, filt = ds_id.split(".")
+        except ValueError:
+            raise UsageError("Invalid ID parameter, expected "
+                             "<dataset>.<dsType>.<filter>") from None
         pos = req.get("POS", None)
         api_params = {"ds": ds}
         if imgserv_config.config_datasets.get(ds, None) is not None:
             api_params["dsType"] = ds_type
             api_params["filter"] = filt
             if pos == "NA" or pos is None:
-                if ds_type == "calexp":
-                    api_params["visit"] = int(req["visit"])
-                    api_params["detector"] = int(req["detector"])
-                    api_params["instrument"] = req["instrument"]
-                elif ds_type == "deepCoadd":
-                    api_params["band"] = req["band"]
-                    api_params["skymap"] = req["skymap"]
-                    api_params["tract"] = int(req["tract"])
-                    api_params["patch"] = int(req["patch"])
-                elif ds_type == "raw":
-                    api_params["instrument"] = req["instrument"]
-                    api_params["detector"] = int(req["detector"])
-                    api_params["exposure"] = int(req["exposure"])
-                else:
-                    raise UsageError("Missing POS or data id in request")
+                try:
+                    api_params.update(
+                        Dispatcher._map_data_id(req, ds_type))
+                except (KeyError, ValueError) as e:
+                    raise UsageError(f"Missing or invalid data id "
+                                     f"in request: {e}") from None
             else:
                 api_params["POS"] = pos
         else:
             raise UsageError("Unrecognized dataset identifier")
         return api_params
+
+    @staticmethod
+    def _map_data_id(req, ds_type):
+        """ Map the data id parameters of the dataset type from the request.
+        """
+        api_params = {}
+        if ds_type == "calexp":
+            api_params["visit"] = int(req["visit"])
+            api_params["detector"] = int(req["detector"])
+            api_params["instrument"] = req["instrument"]
+        elif ds_type == "deepCoadd":
+            api_params["band"] = req["band"]
+            api_params["skymap"] = req["skymap"]
+            api_params["tract"] = int(req["tract"])
+            api_params["patch"] = int(req["patch"])
+        elif ds_type == "raw":
+            api_params["instrument"] = req["instrument"]
+            api_params["detector"] = int(req["detector"])
+            api_params["exposure"] = int(req["exposure"])
+        else:
+            raise UsageError("Missing POS or data id in request")
+        return api_params
@@ -25,9 +25,13 @@ cutout dimensions, via the appropriate Butler object passed in.
 
 """
 import math
+import threading
+from collections import OrderedDict
 from urllib.parse import urlparse, parse_qs
 import etc.imgserv.imgserv_config as imgserv_config
 
+import numpy as np
+
 import lsst.geom as Geom
 import lsst.afw.image as afwImage
 from lsst.afw.geom import SpanSet, Stencil, makeSkyWcs, Polygon
@@ -38,6 +42,21 @@ from .skymapImage import SkymapImage
 from ..exceptions import ImageNotFoundError, UsageError
 
 
+# bounded pool of WCS already retrieved through the butler, so repeated
+# cutouts from the same image skip the lookup.
+_WCS_POOL_MAX = 16
+_wcs_pool = OrderedDict()
+_wcs_pool_lock = threading.RLock()
+
+# the supported dataId key combinations, in order of precedence, each
+# paired with its key set for the presence check.
+_DATA_ID_KEYS = tuple((frozenset(keys), keys) for keys in (
+    ("visit", "detector", "instrument"),
+    ("band", "skymap", "tract", "patch"),
+    ("instrument", "detector", "exposure"),
+))
+
+
 class ImageGetter:
     """Provide operations to retrieve images including cutouts from the
     specified image repository through the passed-in butler and metaget.
@@ -244,22 +263,17 @@ class ImageGetter:
             nargs = len(pos_items)
             if nargs < 5:
                 raise UsageError("BBOX: invalid input parameters")
-            ra, dec = float(pos_items[1]), float(pos_items[2])
-            w, h = float(pos_items[3]), float(pos_items[4])
+            ra, dec, w, h = self._parse_pos_values(shape, pos_items[1:5])
             if nargs == 6:
                 unit_size = pos_items[5]
             else:
                 unit_size = "deg"  # default
-            if src_img is None:
-                cutout = self.cutout_from_nearest(ra, dec, w, h, unit_size, filt)
-            else:
-                cutout = self._cutout_from_image(src_img, ra, dec, w, h, unit_size, data_id)
-            return cutout
+            return self._cutout_nearest_or_image(src_img, ra, dec, w, h,
+                                                 unit_size, filt, data_id)
         elif shape == "CIRCLE":
             if len(pos_items) < 4:
                 raise UsageError("CIRCLE: invalid number of values")
-            ra, dec = float(pos_items[1]), float(pos_items[2])
-            radius = float(pos_items[3])
+            ra, dec, radius = self._parse_pos_values(shape, pos_items[1:4])
             if src_img is None:
                 q_result = self._metaget.nearest_image_contains(ds_type, ra, dec, radius, filt)
                 data_id = self.data_id_from_obscore(q_result)
@@ -283,8 +297,8 @@ class ImageGetter:
             if len(pos_items) < 5:
                 raise UsageError("RANGE: invalid number of values")
             # convert the pair of (ra,dec) to bbox
-            ra1, ra2 = float(pos_items[1]), float(pos_items[2])
-            dec1, dec2 = float(pos_items[3]), float(pos_items[4])
+            ra1, ra2, dec1, dec2 = self._parse_pos_values(shape,
+                                                          pos_items[1:5])
             box = Geom.Box2D(Geom.Point2D(ra1, dec1), Geom.Point2D(ra2, dec2))
             # convert from deg to arcsec
             w = box.getWidth() * 3600
@@ -292,19 +306,14 @@ class ImageGetter:
             # compute the arithmetic center (ra, dec) of the range
             ra = (ra1 + ra2) / 2
             dec = (dec1 + dec2) / 2
-            if src_img is None:
-                cutout = self.cutout_from_nearest(ra, dec, w, h, "arcsec", filt)
-            else:
-                cutout = self._cutout_from_image(src_img, ra, dec, w, h, "arcsec", data_id)
-            return cutout
+            return self._cutout_nearest_or_image(src_img, ra, dec, w, h,
+                                                 "arcsec", filt, data_id)
         elif shape == "POLYGON":
             if len(pos_items) < 7:
                 raise UsageError("POLYGON: invalid number of values")
-            vertices = []
-            pos_items.pop(0)
-            for long, lat in zip(pos_items[::2], pos_items[1::2]):
-                pt = Geom.Point2D(float(long), float(lat))
-                vertices.append(pt)
+            coords = self._parse_pos_values(shape, pos_items[1:])
+            vertices = [Geom.Point2D(long, lat)
+                        for long, lat in zip(coords[::2], coords[1::2])]
             polygon = Polygon(vertices)
             center = polygon.calculateCenter()
             ra, dec = center.getX(), center.getY()
@@ -312,14 +321,65 @@ class ImageGetter:
             bbox = polygon.getBBox()
             w = bbox.getWidth()
             h = bbox.getHeight()
-            if src_img is None:
-                cutout = self.cutout_from_nearest(ra, dec, w, h, "deg", filt)
-            else:
-                cutout = self._cutout_from_image(src_img, ra, dec, w, h, "deg", data_id)
-            return cutout
+            return self._cutout_nearest_or_image(src_img, ra, dec, w, h,
+                                                 "deg", filt, data_id)
         else:
             raise UsageError("Invalid shape in POS")
 
+    def _cutout_nearest_or_image(self, src_img, ra, dec, width, height, unit,
+                                 filt, data_id):
+        """ Get the cutout of the source image if given, else of the nearest
+        image containing the center.
+
+        Parameters
+        ----------
+        src_img: `afwImage.Exposure`
+            the source image, or `None`.
+        ra : `float`
+        dec : `float`
+            in degrees.
+        width : `float`
+        height : `float`
+        unit : `str`
+        filt : `str`
+            the filter, used for the nearest image only.
+        data_id : `dict`
+            the data id of the source image.
+
+        Returns
+        -------
+        cutout: `afwImage.Exposure`
+
+        """
+        if src_img is None:
+            return self.cutout_from_nearest(ra, dec, width, height, unit, filt)
+        return self._cutout_from_image(src_img, ra, dec, width, height, unit,
+                                       data_id)
+
+    @staticmethod
+    def _parse_pos_values(shape, values):
+        """ Parse the numeric values of a POS shape in a single pass.
+
+        Parameters
+        ----------
+        shape : `str`
+            the shape name, for error reporting.
+        values : `list` [`str`]
+            the values following the shape name.
+
+        Returns
+        -------
+        values : `list` [`float`]
+
+        """
+        try:
+            arr = np.asarray(values, dtype=np.float64)
+        except ValueError:
+            raise UsageError(f"{shape}: invalid numeric value") from None
+        if not np.isfinite(arr).all():
+            raise UsageError(f"{shape}: invalid numeric value")
+        return arr.tolist()
+
     def _cutout_from_image(self, src_image, ra, dec, width, height, unit="pixel", data_id=None):
         """ Get the Exposure cutout including wcs headers.
 
@@ -434,7 +494,7 @@ class ImageGetter:
         pix_ulx = int(xy_center_x - width / 2.0)
         pix_uly = int(xy_center_y - height / 2.0)
         xy_center = Geom.Point2I(pix_ulx, pix_uly)
-        log.debug("xy_center={}".format(xy_center))
+        log.debug("xy_center=%s", xy_center)
         src_box = src_img.getBBox()
         # assuming both src_box and xy_center to be in Box2I
         co_box = Geom.Box2I(xy_center, Geom.Extent2I(int(width), int(height)))
@@ -444,10 +504,8 @@ class ImageGetter:
             log.debug("cutout image wanted is OUTSIDE source image -> None")
             raise UsageError("non-overlapping cutout bbox")
         if isinstance(src_img, afwImage.ExposureF):
-            log.debug("co_box pix_ulx={} pix_end_x={} pix_uly={} pix_end_y={}".format(pix_ulx,
-                                                                                      pix_ulx + width,
-                                                                                      pix_uly,
-                                                                                      pix_uly + height))
+            log.debug("co_box pix_ulx=%s pix_end_x=%s pix_uly=%s pix_end_y=%s",
+                      pix_ulx, pix_ulx + width, pix_uly, pix_uly + height)
             # image will keep wcs from source image
             cutout = afwImage.ExposureF(src_img, co_box)
         elif isinstance(src_img, afwImage.ExposureU):
@@ -457,12 +515,30 @@ class ImageGetter:
         return cutout
 
     def _get_wcs_from_butler(self, data_id):
+        try:
+            key = (id(self._butler), self._ds_type,
+                   tuple(sorted(data_id.items())))
+            hash(key)
+        except TypeError:
+            # unhashable data id, bypass the pool
+            return self._butler.get(self._ds_type + ".wcs", dataId=data_id)
+        with _wcs_pool_lock:
+            cached = _wcs_pool.get(key)
+            if cached is not None:
+                _wcs_pool.move_to_end(key)
+                return cached[1]
         wcs = self._butler.get(self._ds_type + ".wcs", dataId=data_id)
+        with _wcs_pool_lock:
+            # keep the butler referenced so its id stays unique
+            _wcs_pool[key] = (self._butler, wcs)
+            _wcs_pool.move_to_end(key)
+            if len(_wcs_pool) > _WCS_POOL_MAX:
+                _wcs_pool.popitem(last=False)
         return wcs
 
     def _image_from_butler(self, data_id, bbox=None):
         # Retrieve the image through the Butler using data id.
-        log.debug("_image_from_butler data_id:{}".format(data_id))
+        log.debug("_image_from_butler data_id:%s", data_id)
         try:
             image = self._butler.get(self._ds_type, dataId=data_id, parameters={"bbox": bbox}, immediate=True)
         except Exception as e:
@@ -471,22 +547,10 @@ class ImageGetter:
 
     @staticmethod
     def data_id_from_params(params):
-        if set(params.keys()) >= {"instrument", "detector", "visit"}:
-            data_id = {"visit": params.get("visit"),
-                       "detector": params.get("detector"),
-                       "instrument": params.get("instrument")}
-        elif set(params.keys()) >= {"band", "skymap", "tract", "patch"}:
-            data_id = {"band": params.get("band"),
-                       "skymap": params.get("skymap"),
-                       "tract": params.get("tract"),
-                       "patch": params.get("patch")}
-        elif set(params.keys()) >= {"instrument", "detector", "exposure"}:
-            data_id = {"instrument": params.get("instrument"),
-                       "detector": params.get("detector"),
-                       "exposure": params.get("exposure")}
-        else:
-            raise UsageError("Invalid dataId")
-        return data_id
+        for key_set, keys in _DATA_ID_KEYS:
+            if key_set.issubset(params):
+                return {k: params[k] for k in keys}
+        raise UsageError("Invalid dataId")
 
     @staticmethod
     def data_id_from_obscore(q_results):
@@ -23,6 +23,8 @@
 Module to stitch together SkyMap images.
 
 """
+import threading
+
 import lsst.geom as geom
 import lsst.afw.image as afw_image
 import lsst.afw.math as afw_math
@@ -32,6 +34,45 @@ import lsst.pex.config as pex_config
 
 from .coadd import Coadd
 
+# Warper of each thread, built once: its warping kernel is stateful. The
+# Warper computes the WCS transform exactly on a coarse grid only
+# (WarperConfig.interpLength pixels apart) and interpolates in between.
+_warper_local = threading.local()
+
+
+def _warp_exposure(dest_wcs, dest_bbox, expo):
+    """Warp the exposure to dest_wcs, clipped to dest_bbox.
+    """
+    warper = getattr(_warper_local, "warper", None)
+    if warper is None:
+        warper = afw_math.Warper.fromConfig(afw_math.WarperConfig())
+        _warper_local.warper = warper
+    return warper.warpExposure(destWcs=dest_wcs, srcExposure=expo,
+                               maxBBox=dest_bbox)
+
+
+def _overlaps(dest_wcs, dest_bbox, expo):
+    """Check whether the exposure may contribute pixels to dest_bbox, from
+    its corners mapped to dest_wcs pixels. The bounds are padded by a pixel,
+    as the mapped box only approximates the exposure footprint.
+    """
+    src_wcs = expo.getWcs()
+    bounds = geom.Box2D()
+    for corner in geom.Box2D(expo.getBBox()).getCorners():
+        bounds.include(dest_wcs.skyToPixel(src_wcs.pixelToSky(corner)))
+    bounds.grow(1.0)
+    return bounds.overlaps(geom.Box2D(dest_bbox))
+
+
+def _warp_exposures(dest_wcs, dest_bbox, expo_list):
+    """Warp the exposures to dest_wcs, clipped to dest_bbox, one at a time.
+    Exposures that do not overlap dest_bbox are skipped. Yields the warped
+    exposures in the order of expo_list.
+    """
+    for expo in expo_list:
+        if _overlaps(dest_wcs, dest_bbox, expo):
+            yield _warp_exposure(dest_wcs, dest_bbox, expo)
+
 
 class CoaddConfig(pex_config.Config):
     saveDebugImages = pex_config.Field(
@@ -65,10 +106,28 @@ class SkymapImage(object):
     """skyMapImage returns the stitched together images from the specified
     skyMap.
     """
+    # caching skymap instances per (butler, skymapid)
+    _skymap_instances = {}
+    _lock = threading.Lock()
+
     def __init__(self, butler, skymapid):
+        self._log = log.getLogger("lsst.dax.imgserv.SkymapImage")
         # Get the basic SkyMap information
         self._butler = butler
-        self._skymap = butler.get(skymapid)
+        self._skymap = SkymapImage._get_skymap(butler, skymapid)
+
+    @staticmethod
+    def _get_skymap(butler, skymapid):
+        """Get skymap from cache if available and load it if not.
+        """
+        key = (id(butler), skymapid)
+        with SkymapImage._lock:
+            cached = SkymapImage._skymap_instances.get(key)
+            if cached is None:
+                # keep the butler referenced so its id stays unique
+                cached = (butler, butler.get(skymapid))
+                SkymapImage._skymap_instances[key] = cached
+        return cached[1]
 
     def get(self, center_coord, width, height, filt, units):
         """Merge multiple patches from a SkyMap into a single image.
@@ -98,8 +157,8 @@ class SkymapImage(object):
         for j, tract_patch in enumerate(tract_patch_list):
             tract_info = tract_patch[0]
             patch_list = tract_patch[1]
-            self._log.info("tract_info[{}]={}".format(j, tract_info))
-            self._log.info("patch_list[{}]={}".format(j, patch_list))
+            self._log.info("tract_info[%s]=%s", j, tract_info)
+            self._log.info("patch_list[%s]=%s", j, patch_list)
             src_wcs = tract_info.getWcs()
             src_bbox = geom.Box2I()
             for patch_info in patch_list:
@@ -112,8 +171,8 @@ class SkymapImage(object):
             for patch_info in patch_list:
                 patch_index = patch_info.getIndex()
                 patch_index_str = ','.join(str(i) for i in patch_index)
-                self._log.info("butler.get dataId=filter:{}, tract:{}, "
-                         "patch:{}".format(filt, tract_id, patch_index_str))
+                self._log.info("butler.get dataId=filter:%s, tract:%s, "
+                               "patch:%s", filt, tract_id, patch_index_str)
                 patch_exposure = self._butler.get("deepCoadd",
                         dataId={"filter": filt,
                             "tract": tract_id, "patch": patch_index_str})
@@ -146,8 +205,8 @@ class SkymapImage(object):
                     ur_corner.setY(0)
                     self._log.warn("getSkyMap negative Y for ur_corner")
                 expo_bbox = geom.Box2I(ll_corner, ur_corner)
-            self._log.info("j={} expo_bbox={} sBBox={}".format(j, expo_bbox,
-                                                        src_exposure.getBBox()))
+            self._log.info("j=%s expo_bbox=%s sBBox=%s", j, expo_bbox,
+                           src_exposure.getBBox())
             dest_exposure = afw_image.ExposureF(expo_bbox, src_wcs)
             dest_img = dest_exposure.getMaskedImage()
             begin_x = expo_bbox.getBeginX() - src_image.getX0()
@@ -166,12 +225,15 @@ class SkymapImage(object):
             if end_y > s_img_len_y:
                 new_width = s_img_len_y - begin_y
                 end_y = s_img_len_y
-            self._log.debug("begin_x={} end_x={}".format(begin_x, end_x))
-            self._log.debug("new_width{} = sBBox.EndX{} - sBBox.BeginX{}".format(
-                new_width, src_exposure.getBBox().getEndX(), expo_bbox.getBeginX()))
-            self._log.debug("begin_y={} end_y={}".format(begin_y, end_y))
-            self._log.debug("new_height{} = sBBox.EndY{} - sBBox.BeginY{}".format(
-                new_height, src_exposure.getBBox().getEndY(), expo_bbox.getBeginY()))
+            if self._log.isDebugEnabled():
+                self._log.debug("begin_x=%s end_x=%s", begin_x, end_x)
+                self._log.debug("new_width%s = sBBox.EndX%s - sBBox.BeginX%s",
+                                new_width, src_exposure.getBBox().getEndX(),
+                                expo_bbox.getBeginX())
+                self._log.debug("begin_y=%s end_y=%s", begin_y, end_y)
+                self._log.debug("new_height%s = sBBox.EndY%s - sBBox.BeginY%s",
+                                new_height, src_exposure.getBBox().getEndY(),
+                                expo_bbox.getBeginY())
             if isinstance(src_exposure, afw_image.Exposure):
                 dest_exposure = afw_image.ExposureF(src_exposure, expo_bbox)
             else:
@@ -185,11 +247,9 @@ class SkymapImage(object):
             return dest_exposure_list[0]
         # Need to stitch together the multiple destination exposures.
         self._log.debug("SkymapImage: stitching together multiple destExposures")
-        warper_config = afw_math.WarperConfig()
-        warper = afw_math.Warper.fromConfig(warper_config)
         stitched_exposure = self._stitch_exposures_good_pixel_copy(dest_wcs,
                 dest_bbox,
-                dest_exposure_list, warper)
+                dest_exposure_list)
         return stitched_exposure
 
     def _bbox_for_coords(self, wcs, center_coord, width, height, units):
@@ -207,15 +267,15 @@ class SkymapImage(object):
         if units == "arcsec":
             # center_coord center, RA and Dec with width and height in
             # arcseconds
-            width_half_a = geom.Angle((width / 2.0), geom.arcseconds)
-            height_half_a = geom.Angle((height / 2.0), geom.arcseconds)
-            min_ra = center_coord.getLongitude() - width_half_a
-            min_dec = center_coord.getLatitude() - height_half_a
-            max_ra = center_coord.getLongitude() + width_half_a
-            max_dec = center_coord.getLatitude() + height_half_a
-            ll_coord = geom.SpherePoint(min_ra, min_dec, geom.degrees)
+            width_half_a = (width / 2.0) * geom.arcseconds
+            height_half_a = (height / 2.0) * geom.arcseconds
+            ctr_ra = center_coord.getLongitude()
+            ctr_dec = center_coord.getLatitude()
+            ll_coord = geom.SpherePoint(ctr_ra - width_half_a,
+                                        ctr_dec - height_half_a)
             ll_coord_pix = wcs.skyToPixel(ll_coord)
-            ur_coord = geom.SpherePoint(max_ra, max_dec, geom.degrees)
+            ur_coord = geom.SpherePoint(ctr_ra + width_half_a,
+                                        ctr_dec + height_half_a)
             ur_coord_pix = wcs.skyToPixel(ur_coord)
             p2i_min = geom.Point2I(ll_coord_pix)
             p2i_max = geom.Point2I(ur_coord_pix)
@@ -231,8 +291,7 @@ class SkymapImage(object):
             raise Exception("invalid units {}".format(units))
         return bbox
 
-    def _stitch_exposures(self, dest_wcs, dest_bbox, expo_list, coadd_config,
-                          warper):
+    def _stitch_exposures(self, dest_wcs, dest_bbox, expo_list, coadd_config):
         """Return an exposure matching the dest_wcs and dest_bbox that is
             composed of
         pixels from the exposures in expo_list. Uses coadd_utils.Coadd.
@@ -241,44 +300,37 @@ class SkymapImage(object):
         expo_list    - List of exposures to combine to form destination
                        exposure.
         coadd_config - configuration for Coadd
-        warper      - Warper to use when warping images.
         All exposures need valid WCS.
         """
         coadd = Coadd.fromConfig(
             bbox=dest_bbox,
             wcs=dest_wcs,
             config=coadd_config)
-        for j, expo in enumerate(expo_list):
-            warped_exposure = warper.warpExposure(
-                destWcs=coadd.getWcs(),
-                srcExposure=expo,
-                maxBBox=coadd.getBBox())
-            log.info("warp{}".format(j))
-            j += 1
+        warped_exposures = _warp_exposures(coadd.getWcs(),
+                                           coadd.getBBox(), expo_list)
+        for j, warped_exposure in enumerate(warped_exposures):
+            log.info("warp%s", j)
             coadd.addExposure(warped_exposure)
 
         return coadd.getCoadd()
 
     def _stitch_exposures_good_pixel_copy(self, dest_wcs, dest_bbox, expo_list,
-                                          warper, bad_pixel_mask=None):
+                                          bad_pixel_mask=None):
         """ Return an exposure matching the dest wcs and dest_bbox that is
         composed of
         pixels from the exposures in expo_list. Uses coadd_utils.goodPixelCopy
         @ dest_wcs: WCS object for the destination exposure.
         @ dest_bbox: Bounding box for the destination exposure.
         @ expo_list: List of exposures to combine to form dextination exposure.
-        @ warper: Warper to use when warping images.
         @ bad_pixel_mask: mask for pixels that should not be copied.
         All exposures need valid WCS.
         """
         if bad_pixel_mask is None:
             bad_pixel_mask = afw_image.MaskU.getPlaneBitMask(["EDGE"])
         dest_expo = afw_image.ExposureF(dest_bbox, dest_wcs)
-        for j, expo in enumerate(expo_list):
-            warped_exposure = warper.warpExposure(
-                destWcs=dest_expo.getWcs(),
-                srcExposure=expo,
-                maxBBox=dest_expo.getBBox())
+        warped_exposures = _warp_exposures(dest_expo.getWcs(),
+                                           dest_expo.getBBox(), expo_list)
+        for warped_exposure in warped_exposures:
             src_masked_image = warped_exposure.getMaskedImage()
             dest_masked_image = dest_expo.getMaskedImage()
             coadd_utils.copyGoodPixels(dest_masked_image, src_masked_image,
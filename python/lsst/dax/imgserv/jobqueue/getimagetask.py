@@ -19,6 +19,7 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 import os
+import lsst.log as log
 import lsst.pex.config as pexConfig
 import lsst.pipe.base as pipeBase
 from lsst.utils.timer import timeMethod
@@ -32,6 +33,19 @@ import etc.imgserv.imgserv_config as imgserv_config
 # for imgserv configuration files (internal)
 config_path = os.path.join(os.path.dirname(__file__), "../config/")
 
+# configuration of the default dataset, resolved once per worker
+_default_ds = imgserv_config.config_datasets["default"]
+_task_config = dict(imgserv_config.config_datasets[_default_ds])
+_task_config["DAX_IMG_CONFIG"] = config_path
+if "dax.imgserv.meta.url" not in imgserv_config.webserv_config:
+    log.warn("dax.imgserv.meta.url missing from webserv config, async "
+             "jobs will have no metaserv access")
+_task_config["DAX_IMG_META_URL"] = imgserv_config.webserv_config.get(
+    "dax.imgserv.meta.url", "")
+
+# SODA service of the worker process, shared by its tasks
+_soda = None
+
 
 class GetImageTaskConfig(pexConfig.Config):
     """!Configuration for ImageTask
@@ -46,15 +60,14 @@ class GetImageTask(pipeBase.Task):
     _DefaultName = "GetImageTask"
 
     def __init__(self, *args, **kwargs):
-        pipeBase.Taskinit__(self, *args, **kwargs)
+        pipeBase.Task.__init__(self, *args, **kwargs)
 
     @timeMethod
     def runDataRef(self, dataRef):
-        config = imgserv_config.config_datasets["default"]
-        config["DAX_IMG_CONFIG"] = config_path
-        meta_url = imgserv_config.webserv_config["dax.imgserv.meta.url"]
-        config["DAX_IMG_META_URL"] = meta_url
-        soda = imageSODA.ImageSODA(config)
+        global _soda
+        if _soda is None:
+            _soda = imageSODA.ImageSODA(_task_config)
+        soda = _soda
         cutout = soda.do_sync(dataRef)
         return pipeBase.Struct(image=cutout)
 
@@ -18,13 +18,17 @@
 #
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
+import os
 import tempfile
 from datetime import datetime
 
 from celery import Celery
+from celery.signals import worker_process_init
 
 from flask import current_app
 
+import lsst.log as log
+
 from .getimagetask import GetImageTask
 
 # load config settings for imgserv
@@ -35,6 +39,14 @@ app_celery = Celery("image_worker")
 app_celery.config_from_object('etc.celery.celery_config')
 
 
+@worker_process_init.connect
+def init_worker_process(**kwargs):
+    """ Create the scratch directory for the job results, shared by all
+    tasks of the worker process.
+    """
+    os.makedirs(imgserv_config.DAX_IMG_TEMPDIR, exist_ok=True)
+
+
 def make_celery():
     """
         Initiate the celery app for client access.
@@ -67,21 +79,23 @@ def get_image_async(self, *args, **kwargs):
     """
     job_start_time = datetime.timestamp(datetime.now())
     params = args[0]
-    print("get_image_async called with request params="+str(params))
+    log.debug("get_image_async called with request params=%s", params)
     job_creation_time = kwargs.get("job_creation_time")
     job_owner = kwargs.get("owner")
-    config = imgserv_config.config_datasets["default"]
     task = GetImageTask()
     result = task.runDataRef(params)
-    # save the result image in local temp dir
-    with tempfile.NamedTemporaryFile(dir=config["DAX_IMG_TEMPDIR"],
-                                     prefix="img-",
-                                     suffix=".fits",
-                                     delete=False) as fp:
-        result.get("image").writeFits(fp.name)
+    # save the result image in local temp dir. The file is only created
+    # here to reserve a unique name: cfitsio opens it again by path, so our
+    # descriptor is closed before the write.
+    tmp = tempfile.NamedTemporaryFile(dir=imgserv_config.DAX_IMG_TEMPDIR,
+                                      prefix="img-",
+                                      suffix=".fits",
+                                      delete=False)
+    tmp.close()
+    result.get("image").writeFits(tmp.name)
     job_end_time = datetime.timestamp(datetime.now())
     result = {
-        "job_result": fp.name,
+        "job_result": tmp.name,
         "job_owner": job_owner,
         "job_creation_time": job_creation_time,
         "job_start_time": job_start_time,
@@ -28,29 +28,20 @@ This module implements various JSON-related utility functions and classes.
 def flatten_json(j):
     """ Flatten JSON object into a dictionary. """
     j_d = {}
-
-    def flatten(r, name=""):
+    # walk the nodes with an explicit stack, pushing the members of each
+    # dict in reverse so that keys come out in document order.
+    stack = [(j, "")]
+    while stack:
+        r, name = stack.pop()
         if isinstance(r, dict):
-            for x in r:
-                flatten(r[x], name+x+".")
+            stack.extend((r[x], name+x+".") for x in reversed(list(r)))
         elif isinstance(r, list):
             j_d[name[:-1]] = " ".join([str(i) for i in r])
         else:
             j_d[name[:-1]] = r
-
-    flatten(j)
     return j_d
 
 
-def _endswith(param, k):
-    if param.endswith("."+k):
-        return True
-    elif k == param:
-        return True
-    else:
-        return False
-
-
 def get_params(req):
     """ Get the parameters corresponding to the API.
     The extraction of each parameter is based upon best match
@@ -65,13 +56,14 @@ def get_params(req):
     dict
         the list of parameters and their values.
     """
-    keys = req["api_id"]
+    keys = set(req["api_id"])
     image = req["image"]
     p_list = flatten_json(image)
     # params to be list of all items related to keys
     params = {}
-    for k in keys:
-        for p in p_list:
-            if _endswith(p, k):
-                params[k] = p_list[p]  # keep it
+    for p, v in p_list.items():
+        # p matches k if it is k or ends with "."+k
+        suffixes = [p] + [p[i+1:] for i, c in enumerate(p) if c == "."]
+        for k in keys.intersection(suffixes):
+            params[k] = v  # keep it
     return params
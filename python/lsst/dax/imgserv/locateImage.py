@@ -66,7 +66,7 @@ def open_image(ds, ds_type, config) -> ImageGetter:
     if dataid_keys is None:
         raise UsageError("Invalid dataset type")
     butler_get = ButlerGet.get_butler(ds, repo_root, ds_type, dataid_keys)
-    meta_get = MetaGet(ds, config)
+    meta_get = MetaGet.get_metaget(ds, config)
     return ImageGetter(config, butler_get, meta_get)
 
 
@@ -86,7 +86,7 @@ def get_image(params: dict, config: dict) -> afw_image:
         the requested image if found.
 
     """
-    dispatcher = Dispatcher(config["DAX_IMG_CONFIG"])
+    dispatcher = Dispatcher.get_dispatcher(config["DAX_IMG_CONFIG"])
     api, api_params = dispatcher.find_api(params)
     ds = api_params.get("ds", None)
     if ds is None:
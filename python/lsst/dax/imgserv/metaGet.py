@@ -28,6 +28,9 @@ This module is used to fetch metadata based on astronomical parameters.
 
 """
 import re
+import threading
+
+from flask import current_app, has_app_context
 from sqlalchemy import create_engine
 
 import pyvo as vo
@@ -39,6 +42,9 @@ class MetaGet:
 
     """
 
+    _metaget_instances = {}  # caching MetaGet instances for CLI context only
+    _lock = threading.Lock()
+
     def __init__(self, ds, config):
         """Instantiate MetaServGet for access to image medatadata.
 
@@ -55,7 +61,42 @@ class MetaGet:
         db_url = image_meta_url + "/" + dataset["IMG_OBSCORE_DB"]
         # TODO: Need to test against ObsTAP server
         self._obstap_service = vo.dal.TAPService(db_url)
-        self._engine = create_engine(db_url)
+        # pre-ping so that a cached engine transparently reconnects
+        self._engine = create_engine(
+            db_url,
+            pool_pre_ping=True,
+            pool_size=imgserv_config.META_DB_POOL_SIZE,
+            max_overflow=imgserv_config.META_DB_MAX_OVERFLOW,
+            pool_recycle=imgserv_config.META_DB_POOL_RECYCLE)
+
+    @staticmethod
+    def get_metaget(ds, config):
+        """Get MetaGet instance from cache if available and instantiate if not.
+
+        Parameters
+        ----------
+        ds: `str`
+            the dataset identifier.
+        config: `dict`
+                the configuration file.
+
+        Returns
+        -------
+        metaget : `MetaGet`
+        """
+        if has_app_context():
+            # flask application context
+            metaget_instances = current_app.metaget_instances
+        else:
+            # CLI context
+            metaget_instances = MetaGet._metaget_instances
+        key = (ds, config.get("DAX_IMG_META_URL", ""))
+        with MetaGet._lock:
+            metaget = metaget_instances.get(key)
+            if metaget is None:
+                metaget = MetaGet(ds, config)
+                metaget_instances[key] = metaget
+        return metaget
 
     def adql_nearest_image_contains(self, ra, dec, radius):
         """ Find nearest image containing Circle(ra, dec, radius) from ObsTAP server.
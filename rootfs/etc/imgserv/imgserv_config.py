@@ -25,6 +25,39 @@ from configparser import RawConfigParser
 # See https://www.lsst.org/scientists/keynumbers
 MAX_IMAGE_CUTOUT_SIZE = 9.6
 
+# Size limit (unit in bytes) of the in-memory cache of /sync responses,
+# per server process: the total budget for the container is split over the
+# uwsgi worker processes.
+MAX_CUTOUT_CACHE_TOTAL = int(os.environ.get("DAX_IMG_CUTOUT_CACHE_TOTAL",
+                                            4 * 1024 * 1024 * 1024))
+MAX_CUTOUT_CACHE_SIZE = MAX_CUTOUT_CACHE_TOTAL // max(
+    1, int(os.environ.get("UWSGI_PROCESSES", "1")))
+
+# Maximum number of cutouts in a single /sync/batch request.
+MAX_CUTOUT_BATCH_SIZE = 100
+
+# Number of cutouts of a /sync/batch request computed concurrently.
+MAX_CUTOUT_BATCH_WORKERS = 4
+
+# Cache-Control of /sync cutouts. Access is authorized upstream, so they are
+# private by default; set to "public, ..." to let shared caches (CDN) keep
+# them.
+CUTOUT_CACHE_CONTROL = "private, max-age=86400"
+
+# Cache-Control of the static service documents (index, capabilities and
+# examples). /availability is a health probe, so it is not cached.
+DOC_CACHE_CONTROL = "private, max-age=3600"
+
+# Connection pool settings of the metadata database engine, per dataset.
+# Connections are recycled (unit in seconds) before the server drops them.
+META_DB_POOL_SIZE = 4
+META_DB_MAX_OVERFLOW = 8
+META_DB_POOL_RECYCLE = 300
+
+# Directory for the image results of async jobs, created once per worker.
+DAX_IMG_TEMPDIR = os.environ.get("DAX_IMG_TEMPDIR",
+                                 "/tmp/imageworker_results")
+
 config_datasets = {
     "ci_hsc": {
         "IMG_REPO_ROOT": "/datasets/ci_hsc_gen3/DATA",
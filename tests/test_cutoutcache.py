@@ -0,0 +1,51 @@
+# This file is part of dax_imgserv.
+#
+# Developed for the LSST Data Management System.
+# This product includes software developed by the LSST Project
+# (http://www.lsst.org).
+# See the COPYRIGHT file at the top-level directory of this distribution
+# for details of code ownership.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+from lsst.dax.imgserv.cutoutcache import CutoutCache
+
+
+def test_cutout_cache_key():
+    k1 = CutoutCache.make_key({"ID": "ci_hsc.calexp.r",
+                               "POS": "CIRCLE 37.60 0.10 0.01"})
+    k2 = CutoutCache.make_key({"POS": "CIRCLE 37.6,0.1, 0.010",
+                               "ID": "ci_hsc.calexp.r"})
+    k3 = CutoutCache.make_key({"ID": "ci_hsc.calexp.r",
+                               "POS": "CIRCLE 37.61 0.10 0.01"})
+    assert(k1 == k2)
+    assert(k1 != k3)
+    # only POS is normalized: other values are validated downstream
+    k4 = CutoutCache.make_key({"ID": "ci_hsc.calexp.r", "visit": "1"})
+    k5 = CutoutCache.make_key({"ID": "ci_hsc.calexp.r", "visit": "1.0"})
+    assert(k4 != k5)
+
+
+def test_cutout_cache_eviction():
+    cache = CutoutCache(max_bytes=10)
+    cache.put("a", b"1234", "ea")
+    cache.put("b", b"1234", "eb")
+    assert(cache.get("a") == (b"1234", "ea"))  # "b" now least recent
+    cache.put("c", b"1234", "ec")
+    assert(cache.get("b") is None)
+    assert(cache.get("a") is not None)
+    assert(cache.get("c") is not None)
+    assert(cache.nbytes == 8)
+    cache.put("big", b"x" * 11, "ebig")  # larger than the cache
+    assert(cache.get("big") is None)
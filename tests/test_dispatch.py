@@ -0,0 +1,54 @@
+# This file is part of dax_imgserv.
+#
+# Developed for the LSST Data Management System.
+# This product includes software developed by the LSST Project
+# (http://www.lsst.org).
+# See the COPYRIGHT file at the top-level directory of this distribution
+# for details of code ownership.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import pytest
+
+from lsst.dax.imgserv.dispatch import Dispatcher
+from lsst.dax.imgserv.exceptions import UsageError
+
+
+def test_map_soda_params():
+    params = Dispatcher._map_soda_params({"ID": "ci_hsc.calexp.r",
+                                          "POS": "CIRCLE 37.6 0.1 0.01"})
+    assert(params == {"ds": "ci_hsc", "dsType": "calexp", "filter": "r",
+                      "POS": "CIRCLE 37.6 0.1 0.01"})
+    params = Dispatcher._map_soda_params({"ID": "ci_hsc.calexp.r",
+                                          "instrument": "HSC",
+                                          "detector": "10", "visit": "903334"})
+    assert(params["visit"] == 903334)
+    assert(params["detector"] == 10)
+
+
+@pytest.mark.parametrize("req", [
+    {"POS": "CIRCLE 37.6 0.1 0.01"},                  # missing ID
+    {"ID": "ci_hsc.calexp"},                          # malformed ID
+    {"ID": "ci_hsc.calexp.r.x"},                      # malformed ID
+    {"ID": 1.5},                                      # non-string ID
+    {"ID": "nosuch.calexp.r"},                        # unknown dataset
+    {"ID": "ci_hsc.calexp.r", "instrument": "HSC",
+     "detector": "10"},                               # incomplete data id
+    {"ID": "ci_hsc.calexp.r", "instrument": "HSC",
+     "detector": "10", "visit": "1.0"},               # invalid data id
+    {"ID": "ci_hsc.nosuch.r"},                        # unknown dataset type
+])
+def test_map_soda_params_usage_error(req):
+    with pytest.raises(UsageError):
+        Dispatcher._map_soda_params(req)
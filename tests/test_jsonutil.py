@@ -0,0 +1,32 @@
+# This file is part of dax_imgserv.
+#
+# Developed for the LSST Data Management System.
+# This product includes software developed by the LSST Project
+# (http://www.lsst.org).
+# See the COPYRIGHT file at the top-level directory of this distribution
+# for details of code ownership.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+from lsst.dax.imgserv.jsonutil import flatten_json
+
+
+def test_flatten_json():
+    j = {"image": {"db": "ci_hsc", "pos": {"ra": 37.6, "dec": 0.1}},
+         "size": [100, 200], "unit": "px"}
+    flat = flatten_json(j)
+    assert(flat == {"image.db": "ci_hsc", "image.pos.ra": 37.6,
+                    "image.pos.dec": 0.1, "size": "100 200", "unit": "px"})
+    assert(list(flat) == ["image.db", "image.pos.ra", "image.pos.dec",
+                          "size", "unit"])
@@ -19,6 +19,13 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
+from concurrent.futures import Future
+
+from lsst.dax.imgserv import api_soda
+from lsst.dax.imgserv.cutoutcache import CutoutCache
+from lsst.dax.imgserv.hashutil import Hasher
+import etc.imgserv.imgserv_config as imgserv_config
+
 
 def test_soda_1():
     # ToDo: update this once SODA operations ready for unit testing
@@ -32,3 +39,64 @@ def test_soda_2():
     assert(ret is True)
 
 
+def _post_batch(app, body):
+    client = app.test_client()
+    return client.post("/api/image/soda/sync/batch", json=body)
+
+
+def test_sync_batch_not_a_list(app):
+    resp = _post_batch(app, {"ID": "ci_hsc.calexp.r"})
+    assert(resp.status_code == 400)
+    assert(resp.get_data(as_text=True).startswith("UsageError="))
+    resp = _post_batch(app, [])
+    assert(resp.status_code == 400)
+
+
+def test_sync_batch_oversized(app):
+    n = imgserv_config.MAX_CUTOUT_BATCH_SIZE + 1
+    resp = _post_batch(app, [{"ID": "ci_hsc.calexp.r"}] * n)
+    assert(resp.status_code == 400)
+    assert(resp.get_data(as_text=True).startswith("UsageError="))
+
+
+def test_sync_batch_bad_entry(app):
+    resp = _post_batch(app, [{"ID": "ci_hsc.calexp.r"}, "ci_hsc.calexp.r"])
+    assert(resp.status_code == 400)
+    resp = _post_batch(app, [{"ID": "ci_hsc.calexp.r", "BAND": "0.1 0.2"}])
+    assert(resp.status_code == 400)
+    assert(resp.get_data(as_text=True).startswith("UsageError="))
+
+
+def test_sync_batch_non_string_value(app):
+    # rejected up front, rather than failing in its part
+    resp = _post_batch(app, [{"ID": "ci_hsc.calexp.r", "POS": 1.5}])
+    assert(resp.status_code == 400)
+    assert(resp.get_data(as_text=True).startswith("UsageError="))
+
+
+def test_sync_batch_part_error():
+    ok, failed = Future(), Future()
+    ok.set_result((b"SIMPLE", "etag"))
+    failed.set_exception(RuntimeError("butler failed"))
+    body = b"".join(api_soda._multipart_parts([failed, ok], "b"))
+    assert(b"Content-Type: text/plain\r\nContent-ID: <0@b>" in body)
+    assert(b"RuntimeError=" in body)
+    assert(b"Content-ID: <1@b>\r\n\r\nSIMPLE" in body)
+    assert(body.endswith(b"--b--\r\n"))
+
+
+def test_sync_not_modified(app):
+    # a revalidation is answered from the request alone, with no image access
+    params = {"ID": "ci_hsc.calexp.r", "POS": "CIRCLE 37.60 0.10 0.01"}
+    etag = Hasher.md5(CutoutCache.make_key(dict(params, API="SODA")))
+    client = app.test_client()
+    resp = client.get("/api/image/soda/sync", query_string=params,
+                      headers={"If-None-Match": f'"{etag}"'})
+    assert(resp.status_code == 304)
+    assert(resp.headers["ETag"] == f'"{etag}"')
+    assert("Accept-Encoding" in resp.headers["Vary"])
+    resp = client.get("/api/image/soda/sync", query_string=params,
+                      headers={"If-None-Match": f'"{etag}-gzip"',
+                               "Accept-Encoding": "gzip"})
+    assert(resp.status_code == 304)
+    assert(resp.headers["ETag"] == f'"{etag}-gzip"')